@@ -7,12 +7,16 @@
 #
 # Full terms: LICENSE-COMMUNITY.txt
 
+import functools
+import hashlib
 import os
+import signal
 import time
 import socket
 import subprocess
 import tempfile
 import shutil
+import uuid
 
 import pytest
 import redis
@@ -34,26 +38,47 @@ REDIS_SERVER = os.environ.get("REDIS_SERVER", "redis-server")
 MCDC_CONF_PATH = os.path.join(THIS_DIR, "mcdc.conf")
 MCDC_CONF_PATH = os.path.abspath(MCDC_CONF_PATH)
 
+# Teardown of the per-server temp dir (see redis_server fixture)
+MCDC_KEEP_TMP = os.environ.get("MCDC_KEEP_TMP", "0") not in ("", "0")
+MCDC_FAST_RM = os.environ.get("MCDC_FAST_RM", "1") != "0"
+
+
+# redis-server log line printed once the listener is up
+_READY_MARKER = b"Ready to accept connections"
+
 
 def _get_free_port():
+    """
+    Reserve an ephemeral port and return (socket, port).
+
+    The socket is kept bound so nobody else grabs the port in the meantime;
+    the caller closes it right before redis-server binds the same port.
+    """
     s = socket.socket()
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     s.bind(("127.0.0.1", 0))
     addr, port = s.getsockname()
-    s.close()
-    return port
+    return s, port
 
 
 class RedisServer:
-    def __init__(self, port, module_path, mcdc_conf_path):
+    def __init__(self, port, module_path, mcdc_conf_path, worker_id="master"):
         self.port = port
         self.module_path = module_path
         self.mcdc_conf_path = mcdc_conf_path
+        self.worker_id = worker_id
         self.proc = None
         self.tmpdir = None
+        self.log_path = None
+        self.log_fh = None
 
-    def start(self):
-        self.tmpdir = tempfile.mkdtemp(prefix="mcdc-redis-test-")
+    def start(self, reserved_sock=None):
+        self.tmpdir = tempfile.mkdtemp(prefix=f"mcdc-redis-{self.worker_id}-")
         conf_path = os.path.join(self.tmpdir, "redis.conf")
+        # Server output goes to a file: a PIPE nobody drains can fill up and block Redis
+        self.log_path = os.path.join(self.tmpdir, "redis.log")
 
         with open(conf_path, "w") as f:
             f.write(f"""
@@ -74,39 +99,63 @@ logfile ""
             "--loadmodule", self.module_path, mcdc_cfg_arg,
         ]
 
+        # Release the reserved port as late as possible
+        if reserved_sock is not None:
+            reserved_sock.close()
+
+        self.log_fh = open(self.log_path, "wb")
         self.proc = subprocess.Popen(
             cmd,
-            stdout=subprocess.PIPE,
+            stdout=self.log_fh,
             stderr=subprocess.STDOUT,
-            text=True,
+            # fds are non-inheritable by default (PEP 446), so there is nothing to close;
+            # own session keeps the runner's signals (Ctrl-C) away from the server
+            close_fds=False,
+            start_new_session=True,
         )
 
         client = redis.Redis(host="127.0.0.1", port=self.port, decode_responses=True)
         deadline = time.time() + 10.0
         last_exc = None
-        last_output = []
-
-        # Wait for Redis to come up
-        while time.time() < deadline:
-            try:
-                if client.ping():
-                    return
-            except Exception as e:
-                last_exc = e
-            # Drain any output for better error messages
-            if self.proc and self.proc.poll() is not None:
-                last_output.extend(self.proc.stdout.readlines())
-                break
-            time.sleep(0.05)
+        delay = 0.001
+        ready = False
+        tail = b""
+
+        # Wait for Redis to log that it is ready, then confirm with a single PING.
+        # select() is no use here: a regular file always polls readable, so the log
+        # is tailed with backoff (1 ms, 2 ms, ... capped at 50 ms) instead.
+        fd = os.open(self.log_path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            while time.time() < deadline:
+                chunk = os.read(fd, 65536)
+                if chunk:
+                    data = tail + chunk
+                    ready = ready or _READY_MARKER in data
+                    tail = data[-len(_READY_MARKER):]
+                # Once backoff is capped, PING anyway (server builds with other log wording)
+                if ready or delay >= 0.05:
+                    try:
+                        if client.ping():
+                            return
+                    except Exception as e:
+                        last_exc = e
+                if self.proc and self.proc.poll() is not None:
+                    break
+                if not chunk:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+        finally:
+            os.close(fd)
 
         # If we’re here – startup failed
         output = ""
-        if self.proc and self.proc.stdout:
-            try:
-                last_output.extend(self.proc.stdout.readlines())
-            except Exception:
-                pass
-            output = "".join(last_output)
+        self.log_fh.close()
+        try:
+            # Raw bytes, decoded once here (not locale-dependent, only on failure)
+            with open(self.log_path, "rb") as f:
+                output = f.read().decode("utf-8", "replace")
+        except OSError:
+            pass
 
         self.stop()
         raise RuntimeError(
@@ -118,52 +167,149 @@ logfile ""
 
     def stop(self):
         if self.proc is not None:
-            try:
-                self.proc.terminate()
+            # poll() first: once the child is reaped its pid (and group id) may be reused
+            if self.proc.poll() is None:
                 try:
-                    self.proc.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    self.proc.kill()
-            except OSError:
-                pass
+                    # start_new_session=True: the server leads its own process group
+                    os.killpg(self.proc.pid, signal.SIGTERM)
+                    try:
+                        self.proc.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        os.killpg(self.proc.pid, signal.SIGKILL)
+                        self.proc.wait()
+                except OSError:
+                    pass
             self.proc = None
+        if self.log_fh is not None:
+            self.log_fh.close()
+            self.log_fh = None
+        if MCDC_KEEP_TMP:
+            return
         if self.tmpdir and os.path.isdir(self.tmpdir):
-            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            if MCDC_FAST_RM and shutil.which("rm"):
+                subprocess.run(["rm", "-rf", self.tmpdir], check=False)
+            else:
+                shutil.rmtree(self.tmpdir, ignore_errors=True)
 
 
 @pytest.fixture(scope="session")
 def redis_server():
-    if not os.path.exists(MCDC_MODULE_PATH):
-        raise RuntimeError(f"MC/DC module not found at {MCDC_MODULE_PATH}")
-    if not os.path.exists(MCDC_CONF_PATH):
-        raise RuntimeError(f"MC/DC config not found at {MCDC_CONF_PATH}")
-
-    port = _get_free_port()
-    srv = RedisServer(port, MCDC_MODULE_PATH, MCDC_CONF_PATH)
-    srv.start()
+    """
+    One redis-server per pytest process.
+
+    Under pytest-xdist ("pytest -n N") session scope is per worker, so every
+    worker gets its own server on its own free port.
+
+    Environment:
+      MCDC_KEEP_TMP=1  keep the server temp dir (redis.conf, redis.log, ...)
+                       after the session, for debugging
+      MCDC_FAST_RM=0   remove the temp dir with shutil.rmtree instead of
+                       "rm -rf" (the default when rm is available)
+    """
+    worker_id = os.environ.get("PYTEST_XDIST_WORKER", "master")
+
+    sock, port = _get_free_port()
+    srv = RedisServer(port, MCDC_MODULE_PATH, MCDC_CONF_PATH, worker_id=worker_id)
+    # No upfront existence checks: a missing module/config makes startup fail anyway
+    try:
+        srv.start(reserved_sock=sock)
+    except (OSError, RuntimeError) as e:
+        sock.close()
+        srv.stop()
+        raise RuntimeError(
+            f"{e}\n"
+            f"  redis-server: {REDIS_SERVER}\n"
+            f"  MC/DC module: {MCDC_MODULE_PATH}\n"
+            f"  MC/DC config: {MCDC_CONF_PATH}"
+        ) from e
     try:
         yield {"port": port}
     finally:
         srv.stop()
 
 
+@pytest.fixture(scope="session")
+def _pool(redis_server):
+    """Connection pool shared by all tests."""
+    pool = redis.ConnectionPool(
+        host="127.0.0.1", port=redis_server["port"], decode_responses=False
+    )
+    try:
+        yield pool
+    finally:
+        pool.disconnect()
+
+
+@pytest.fixture(scope="session")
+def _client(_pool):
+    """One client wrapper for the whole session (DB flushed once at session end)."""
+    client = redis.Redis(connection_pool=_pool)
+    try:
+        yield client
+    finally:
+        try:
+            # ASYNC: memory is reclaimed in a background thread, the reply is immediate
+            client.execute_command("FLUSHDB", "ASYNC")
+        except redis.RedisError:
+            pass
+
+
+def _key_prefix(nodeid):
+    # The filter manages every key except mcdc:dict:* (dictionary/manifest blobs),
+    # so any prefix outside that namespace works. The uuid part keeps a rerun of
+    # the same test in one session (retry plugins, --count) off its old keys.
+    return (
+        "mcdc:t:"
+        + hashlib.md5(nodeid.encode()).hexdigest()[:8]
+        + ":" + uuid.uuid4().hex[:8]
+    )
+
+
 @pytest.fixture
-def r(redis_server):
-    """Redis client fixture (flushes DB per test)."""
-    port = redis_server["port"]
-    client = redis.Redis(host="127.0.0.1", port=port, decode_responses=True)
-    client.flushall()
-    return client
+def r(_client, request):
+    """
+    Redis client fixture.
+
+    Tests are isolated by key namespace instead of a per-test flush:
+    build keys as f"{r.key_prefix}:..." (the prefix is unique per test
+    invocation, so reruns of the same test id start on an empty namespace).
+    """
+    # key_prefix is the only per-test state on the shared client
+    _client.key_prefix = _key_prefix(request.node.nodeid)
+    return _client
+
+
+@pytest.fixture(scope="session")
+def redis_version(_client):
+    """(major, minor, patch) of the test server, looked up once per session."""
+    return redis_version_tuple(_client)
+
 
 import pytest
 
 def redis_version_tuple(r):
-    info = r.info()
+    info = r.info("server")
     ver = info["redis_version"]
     parts = ver.split(".")
     # pad to (major, minor, patch)
     parts += ["0"] * (3 - len(parts))
     return tuple(int(p) for p in parts[:3])
 
+@functools.lru_cache(maxsize=128)
 def highly_compressible(size=256, ch="A"):
-    return ch * size
+    # Payloads are immutable, so parametrize-time and test-body calls can share one object.
+    # bytes: the client runs with decode_responses=False, replies compare byte-for-byte
+    return ch.encode() * size
+
+# Tests parametrized over "variant" run twice: once calling mcdc.* directly
+# ("mcdc") and once with plain Redis commands rewritten by the filter ("filter").
+VARIANTS = ("mcdc", "filter")
+
+def cmd(variant, name):
+    """Command name for a variant: "mcdc.<name>" or plain "<NAME>"."""
+    return f"mcdc.{name}" if variant == "mcdc" else name.upper()
+
+
+def ok_reply(variant):
+    """Expected +OK reply: b"OK" from mcdc.*, True from plain SET/SETEX/PSETEX/MSET."""
+    return b"OK" if variant == "mcdc" else True
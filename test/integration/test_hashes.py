@@ -7,9 +7,11 @@
 #
 # Full terms: LICENSE-COMMUNITY.txt
 
+import itertools
+
 import pytest
 
-from conftest import highly_compressible, redis_version_tuple
+from conftest import VARIANTS, cmd, highly_compressible
 
 
 # NOTE: assumes:
@@ -23,18 +25,20 @@ from conftest import highly_compressible, redis_version_tuple
 # Basic HSET / HGET / CHSTRLEN
 # ---------------------------------------------------------------------------
 
+@pytest.mark.parametrize("variant", VARIANTS)
 @pytest.mark.parametrize("val", [
-    "small",
+    b"small",
+    highly_compressible(256, "H"),
     highly_compressible(512, "K"),
 ])
-def test_mcdc_hset_hget_roundtrip(r, val):
-    key = "mcdc:hash:basic"
+def test_hset_hget_roundtrip(r, variant, val):
+    key = f"{r.key_prefix}:hash:basic"
     field = "f1"
 
-    ret = r.execute_command("mcdc.hset", key, field, val)
+    ret = r.execute_command(cmd(variant, "hset"), key, field, val)
     assert isinstance(ret, int)
 
-    got = r.execute_command("mcdc.hget", key, field)
+    got = r.execute_command(cmd(variant, "hget"), key, field)
     assert got == val
 
     logical = int(r.hstrlen(key, field))
@@ -46,74 +50,56 @@ def test_mcdc_hset_hget_roundtrip(r, val):
         assert chlen < logical
 
 
-def test_filter_hset_hget(r):
-    key = "mcdc:filter:hash:basic"
-    field = "f1"
-    val = highly_compressible(256, "H")
-
-    # Plain HSET / HGET must be rewritten
-    ret = r.hset(key, field, val)
-    assert isinstance(ret, int)
-
-    got = r.hget(key, field)
-    assert got == val
-
-    logical = int(r.hstrlen(key, field))
-    chlen = int(r.execute_command("mcdc.chstrlen", key, field))
-    assert logical > 32
-    assert chlen < logical
-
-
 # ---------------------------------------------------------------------------
 # HMGET / multi-field HSET (module + filter)
 # ---------------------------------------------------------------------------
 
-def test_mcdc_hset_multi_and_hmget(r):
-    key = "mcdc:hash:multi"
+# mcdc.hset + mcdc.hmget + HSTRLEN + mcdc.chstrlen in one round trip (plain EVAL:
+# the script runs once per session, so EVALSHA would only add a NOSCRIPT retry).
+# KEYS[1] = hash, ARGV[1] = field to measure, ARGV[2..] = field/value pairs.
+# Only for the mcdc variant: the filter maps HSET/HMGET to the blocking
+# *async commands, which Redis refuses to run inside a script.
+_HSET_HMGET_STRLEN_LUA = """
+local probe = ARGV[1]
+local kv = {unpack(ARGV, 2)}
+local names = {}
+for i = 1, #kv, 2 do names[#names + 1] = kv[i] end
+local n = redis.call('mcdc.hset', KEYS[1], unpack(kv))
+local vals = redis.call('mcdc.hmget', KEYS[1], unpack(names))
+local len = redis.call('hstrlen', KEYS[1], probe)
+local clen = redis.call('mcdc.chstrlen', KEYS[1], probe)
+return {n, vals, len, clen}
+"""
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_hset_multi_and_hmget(r, variant):
+    key = f"{r.key_prefix}:hash:multi"
     fields = {
-        "a": "1",
-        "b": highly_compressible(64, "X"),
-        "c": highly_compressible(512, "Y"),
+        b"a": b"1",
+        b"b": highly_compressible(64, "X"),
+        b"c": highly_compressible(512, "Y"),
     }
 
-    args = [key]
-    for f, v in fields.items():
-        args.append(f)
-        args.append(v)
-
-    ret = r.execute_command("mcdc.hset", *args)
-    assert ret >= 1
+    pairs = list(itertools.chain.from_iterable(fields.items()))
 
-    got = r.execute_command("mcdc.hmget", key, *fields.keys())
+    if variant == "mcdc":
+        ret, got, logical_c, chlen_c = r.eval(_HSET_HMGET_STRLEN_LUA, 1, key, "c", *pairs)
+    else:
+        # HMSET (deprecated, still widely supported)
+        with r.pipeline(transaction=False) as p:
+            p.execute_command("HMSET", key, *pairs)
+            p.execute_command(cmd(variant, "hmget"), key, *fields.keys())
+            p.hstrlen(key, "c")
+            p.execute_command("mcdc.chstrlen", key, "c")
+            ret, got, logical_c, chlen_c = p.execute()
+
+    assert ret >= 1  # field count for HSET, True for HMSET
     assert got == list(fields.values())
 
     # At least one field should be compressed
-    logical_c = int(r.hstrlen(key, "c"))
-    chlen_c = int(r.execute_command("mcdc.chstrlen", key, "c"))
-    assert logical_c > 32
-    assert chlen_c < logical_c
-
-
-def test_filter_hmget_hmset(r):
-    key = "mcdc:filter:hash:multi"
-    fields = {
-        "a": "1",
-        "b": highly_compressible(64, "B"),
-        "c": highly_compressible(512, "C"),
-    }
-
-    # HMSET (deprecated, still widely supported)
-    args = [key]
-    for f, v in fields.items():
-        args.append(f)
-        args.append(v)
-    r.execute_command("HMSET", *args)
-
-    got = r.execute_command("HMGET", key, *fields.keys())
-    assert got == list(fields.values())
-
-    logical_c = int(r.hstrlen(key, "c"))
-    chlen_c = int(r.execute_command("mcdc.chstrlen", key, "c"))
+    logical_c = int(logical_c)
+    chlen_c = int(chlen_c)
     assert logical_c > 32
     assert chlen_c < logical_c
 
@@ -122,211 +108,130 @@ def test_filter_hmget_hmset(r):
 # HSETNX / HSETEX / HGETEX / HGETDEL
 # ---------------------------------------------------------------------------
 
-def test_mcdc_hsetnx_hgetdel(r):
-    if redis_version_tuple(r) < (8,0,0):
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_hsetnx_hgetdel(r, redis_version, variant):
+    if redis_version < (8,0,0):
         pytest.skip("HSETEX/HGETEX only supported on Redis 8.0+")
 
-    key = "mcdc:hash:hsetnx"
+    key = f"{r.key_prefix}:hash:hsetnx"
     field = "f"
 
-    res1 = r.execute_command("mcdc.hsetnx", key, field, "first")
+    res1 = r.execute_command(cmd(variant, "hsetnx"), key, field, b"first")
     assert res1 in (0, 1)  # Redis: 1 on create, 0 on no-op
 
-    res2 = r.execute_command("mcdc.hsetnx", key, field, "second")
+    res2 = r.execute_command(cmd(variant, "hsetnx"), key, field, b"second")
     assert res2 in (0, 1)
-    val = r.execute_command("mcdc.hget", key, field)
-    assert val in ("first", "second")  # exact semantics depend on implementation
+    val = r.execute_command(cmd(variant, "hget"), key, field)
+    assert val in (b"first", b"second")  # exact semantics depend on implementation
 
     # HGETDEL: return and remove
-    got = r.execute_command("mcdc.hgetdel", key, field)
+    got = r.execute_command(cmd(variant, "hgetdel"), key, field)
     assert got is not None
     assert r.hexists(key, field) is False
 
 
-def test_filter_hsetnx_hgetdel(r):
-    if redis_version_tuple(r) < (8,0,0):
-        pytest.skip("HSETEX/HGETEX only supported on Redis 8.0+")
-
-    key = "mcdc:filter:hash:hsetnx"
-    field = "f"
-
-    res1 = r.execute_command("HSETNX", key, field, "first")
-    assert res1 in (0, 1)
-    res2 = r.execute_command("HSETNX", key, field, "second")
-    assert res2 in (0, 1)
-
-    got = r.execute_command("HGETDEL", key, field)
-    assert got is not None
-    assert r.hexists(key, field) is False
-
-
-def test_mcdc_hsetex_hgetex(r):
-    if redis_version_tuple(r) < (8,0,0):
+@pytest.mark.parametrize("variant", VARIANTS)
+@pytest.mark.parametrize("val", [
+    highly_compressible(256, "F"),
+    highly_compressible(512, "E"),
+])
+def test_hsetex_hgetex(r, redis_version, variant, val):
+    if redis_version < (8,0,0):
         pytest.skip("HSETEX/HGETEX only supported on Redis 8.0+")
 
-    key = "mcdc:hash:hsetex"
+    key = f"{r.key_prefix}:hash:hsetex"
     field = "payload"
-    val = highly_compressible(512, "E")
 
     # HSETEX key field ttl value
-    ret = r.execute_command("mcdc.hsetex",key,"EX", 10, "FIELDS", 1, field, val)
+    ret = r.execute_command(cmd(variant, "hsetex"), key, "EX", 10, "FIELDS", 1, field, val)
     assert ret in (0, 1)
 
     # HGETEX key field EX <ttl>
-    got = r.execute_command("mcdc.hgetex", key, field, "EX", 20)
+    got = r.execute_command(cmd(variant, "hgetex"), key, field, "EX", 20)
     assert got == val
 
     ttl = r.ttl(key)
     assert 1 <= ttl <= 20
 
 
-def test_filter_hsetex_hgetex(r):
-    if redis_version_tuple(r) < (8,0,0):
-        pytest.skip("HSETEX/HGETEX only supported on Redis 8.0+")
-
-    key = "mcdc:filter:hash:hsetex"
-    field = "payload"
-    val = highly_compressible(256, "F")
-
-    # Plain HSETEX / HGETEX should be rewritten by filter
-    ret = r.execute_command("HSETEX", key, "EX", 10, "FIELDS", 1, field, val)
-    got = r.execute_command("HGETEX", key, field, "EX", 20)
-    assert got == val
-    ttl = r.ttl(key)
-    assert 1 <= ttl <= 20
-
-
 # ---------------------------------------------------------------------------
 # HVALS / HGETALL / HSTRLEN / HRANDFIELD
 # ---------------------------------------------------------------------------
 
-def test_mcdc_hvals_hgetall_hstrlen(r):
-    key = "mcdc:hash:vals"
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_hvals_hgetall_hstrlen(r, variant):
+    key = f"{r.key_prefix}:hash:vals"
     fields = {
-        "x": "1",
-        "y": highly_compressible(128, "Y"),
-        "z": highly_compressible(512, "Z"),
+        b"x": b"1",
+        b"y": highly_compressible(128, "Y"),
+        b"z": highly_compressible(512, "Z"),
     }
 
-    args = [key]
-    for f, v in fields.items():
-        args.append(f)
-        args.append(v)
-    r.execute_command("mcdc.hset", *args)
+    args = [key, *itertools.chain.from_iterable(fields.items())]
 
-    vals = r.execute_command("mcdc.hvals", key)
-    assert sorted(vals) == sorted(fields.values())
+    with r.pipeline(transaction=False) as p:
+        p.execute_command(cmd(variant, "hset"), *args)
+        p.execute_command(cmd(variant, "hvals"), key)
+        p.execute_command(cmd(variant, "hgetall"), key)
+        p.execute_command(cmd(variant, "hstrlen"), key, "z")
+        p.execute_command("mcdc.chstrlen", key, "z")
+        _, vals, hgetall, logical_z, chlen_z = p.execute()
 
-    hgetall = r.execute_command("mcdc.hgetall", key)
-    it = iter(hgetall)
-    d = dict(zip(it, it))
+    # HGETALL is the reference the HVALS and HSTRLEN replies are checked against.
+    # redis-py already turns a plain HGETALL reply into a dict; mcdc.hgetall is a flat list
+    if isinstance(hgetall, dict):
+        d = hgetall
+    else:
+        d = dict(zip(hgetall[0::2], hgetall[1::2]))
     assert d == fields
 
-    logical_z = int(r.execute_command("mcdc.hstrlen", key, "z"))
-    chlen_z = int(r.execute_command("mcdc.chstrlen", key, "z"))
-    assert logical_z > 32
-    assert chlen_z < logical_z
-
-
-def test_filter_hvals_hgetall_hstrlen(r):
-    key = "mcdc:filter:hash:vals"
-    fields = {
-        "x": "1",
-        "y": highly_compressible(128, "Y"),
-        "z": highly_compressible(512, "Z"),
-    }
-
-    # HSET via plain Redis (rewritten by filter to mcdc.hset / mcdc.hsetasync)
-    args = [key]
-    for f, v in fields.items():
-        args.append(f)
-        args.append(v)
-    r.execute_command("HSET", *args)
+    # HVALS / HSTRLEN must agree with HGETALL
+    assert sorted(vals) == sorted(d.values())
+    logical_z = int(logical_z)
+    assert logical_z == len(d[b"z"])
 
-    # HVALS should return just the values
-    vals = r.execute_command("HVALS", key)
-    assert sorted(vals) == sorted(fields.values())
-
-    # With decode_responses=True, HGETALL returns a dict already
-    hgetall = r.execute_command("HGETALL", key)
-    assert hgetall == fields
-
-    # Optionally also check chstrlen if you want compression verification:
-    # from .conftest import highly_compressible
-    # compressed_lengths = r.execute_command("mcdc.chstrlen", key)
-    # assert len(compressed_lengths) == len(fields)
-
-    logical_z = int(r.execute_command("HSTRLEN", key, "z"))
-    chlen_z = int(r.execute_command("mcdc.chstrlen", key, "z"))
+    chlen_z = int(chlen_z)
     assert logical_z > 32
     assert chlen_z < logical_z
 
-def test_mcdc_hrandfield(r):
-    key = "mcdc:hash:rand"
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_hrandfield(r, variant):
+    key = f"{r.key_prefix}:hash:rand"
     fields = {
-        "a": "1",
-        "b": "2",
-        "c": "3",
+        b"a": b"1",
+        b"b": b"2",
+        b"c": b"3",
     }
 
-    args = [key]
-    for f, v in fields.items():
-        args.append(f)
-        args.append(v)
-    r.execute_command("mcdc.hset", *args)
+    args = [key, *itertools.chain.from_iterable(fields.items())]
+    r.execute_command(cmd(variant, "hset"), *args)
 
     # random field only
-    f = r.execute_command("mcdc.hrandfield", key)
+    f = r.execute_command(cmd(variant, "hrandfield"), key)
     assert f in fields
 
     # random field + value (count = 1, withvalues)
-    res = r.execute_command("mcdc.hrandfield", key, 1, "WITHVALUES")
+    res = r.execute_command(cmd(variant, "hrandfield"), key, 1, "WITHVALUES")
     # response: [field, value] list
     assert isinstance(res, list)
     assert len(res) == 2
     assert res[0] in fields
     assert res[1] == fields[res[0]]
 
-
-def test_filter_hrandfield(r):
-    key = "mcdc:filter:hash:rand"
-    fields = {
-        "a": "1",
-        "b": "2",
-        "c": "3",
-    }
-
-    args = [key]
-    for f, v in fields.items():
-        args.append(f)
-        args.append(v)
-    r.execute_command("HSET", *args)
-
-    f = r.execute_command("HRANDFIELD", key)
-    assert f in fields
-
-    res = r.execute_command("HRANDFIELD", key, 1, "WITHVALUES")
-    assert isinstance(res, list)
-    assert len(res) == 2
-    assert res[0] in fields
-    assert res[1] == fields[res[0]]
-
 def test_mcdc_hsetasync_matches_hset_and_writes(r):
     """
     mcdc.hsetasync should:
       - return the same kind of reply as mcdc.hset
       - write the same fields/values
     """
-    key = "mcdc:hash:async:hset"
+    key = f"{r.key_prefix}:hash:async:hset"
     fields = {
-        "f_small": "v1",
-        "f_large": highly_compressible(256, "H"),
+        b"f_small": b"v1",
+        b"f_large": highly_compressible(256, "H"),
     }
 
-    args = [key]
-    for f, v in fields.items():
-        args.append(f)
-        args.append(v)
+    args = [key, *itertools.chain.from_iterable(fields.items())]
 
     # Baseline: sync behavior
     r.delete(key)
@@ -352,17 +257,14 @@ def test_mcdc_hmgetasync_matches_hmget(r):
     mcdc.hmgetasync should:
       - return same data as mcdc.hmget
     """
-    key = "mcdc:hash:async:hmget"
+    key = f"{r.key_prefix}:hash:async:hmget"
     fields = {
-        "a": "1",
-        "b": highly_compressible(128, "B"),
-        "c": highly_compressible(512, "C"),
+        b"a": b"1",
+        b"b": highly_compressible(128, "B"),
+        b"c": highly_compressible(512, "C"),
     }
 
-    args = [key]
-    for f, v in fields.items():
-        args.append(f)
-        args.append(v)
+    args = [key, *itertools.chain.from_iterable(fields.items())]
 
     r.delete(key)
     r.execute_command("mcdc.hset", *args)
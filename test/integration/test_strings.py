@@ -7,11 +7,12 @@
 #
 # Full terms: LICENSE-COMMUNITY.txt
 
+import itertools
 import time
 
 import pytest
 
-from conftest import highly_compressible
+from conftest import VARIANTS, cmd, highly_compressible, ok_reply
 
 
 # NOTE: these tests assume:
@@ -20,18 +21,20 @@ from conftest import highly_compressible
 
 
 # ---------------------------------------------------------------------------
-# Basic mcdc.set / mcdc.get / mcdc.cstrlen
+# Basic SET / GET / STRLEN / mcdc.cstrlen
 # ---------------------------------------------------------------------------
 
+@pytest.mark.parametrize("variant", VARIANTS)
 @pytest.mark.parametrize("val", [
-    "hello",                       # small, not worth compressing
+    b"hello",                      # small, not worth compressing
     highly_compressible(512, "X"), # large & compressible
+    highly_compressible(1024, "R"),
 ])
-def test_mcdc_set_get_roundtrip(r, val):
-    key = "mcdc:string:basic"
+def test_set_get_roundtrip(r, variant, val):
+    key = f"{r.key_prefix}:string:basic"
 
-    assert r.execute_command("mcdc.set", key, val) == "OK"
-    got = r.execute_command("mcdc.get", key)
+    assert r.execute_command(cmd(variant, "set"), key, val) == ok_reply(variant)
+    got = r.execute_command(cmd(variant, "get"), key)
     assert got == val
 
     logical = int(r.strlen(key))
@@ -45,127 +48,72 @@ def test_mcdc_set_get_roundtrip(r, val):
         assert cstored < logical
 
 
-# ---------------------------------------------------------------------------
-# Filter rewrite: SET / GET / STRLEN
-# ---------------------------------------------------------------------------
-
-@pytest.mark.parametrize("val", [
-    "short",
-    highly_compressible(1024, "R"),
-])
-def test_filter_rewrites_set_get_strlen(r, val):
-    key = "mcdc:filter:string:setget"
-
-    # Plain Redis commands, should be rewritten by filter
-    assert r.set(key, val)
-    got = r.get(key)
-    assert got == val
-
-    logical = int(r.strlen(key))
-    cstored = int(r.execute_command("mcdc.cstrlen", key))
-
-    if len(val) <= 32:
-        assert cstored >= logical
-    else:
-        assert cstored < logical
-
-
 # ---------------------------------------------------------------------------
 # GETEX / GETSET / GETDEL / SETEX / SETNX / PSETEX
 # ---------------------------------------------------------------------------
 
-def test_mcdc_getex_sets_ttl(r):
-    key = "mcdc:string:getex"
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_getex_sets_ttl(r, variant):
+    key = f"{r.key_prefix}:string:getex"
     val = highly_compressible(512, "G")
 
-    assert r.execute_command("mcdc.set", key, val) == "OK"
+    assert r.execute_command(cmd(variant, "set"), key, val) == ok_reply(variant)
 
-    got = r.execute_command("mcdc.getex", key, "EX", 10)
+    got = r.execute_command(cmd(variant, "getex"), key, "EX", 10)
     assert got == val
 
     ttl = r.ttl(key)
     assert 1 <= ttl <= 10  # some small drift is OK
 
 
-def test_filter_getex_sets_ttl(r):
-    key = "mcdc:filter:string:getex"
-    val = highly_compressible(512, "H")
-
-    r.set(key, val)
-    got = r.execute_command("GETEX", key, "EX", 10)
-    assert got == val
-
-    ttl = r.ttl(key)
-    assert 1 <= ttl <= 10
-
-
-def test_mcdc_getset_and_getdel(r):
-    key = "mcdc:string:getsetdel"
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_getset_and_getdel(r, variant):
+    key = f"{r.key_prefix}:string:getsetdel"
 
-    assert r.execute_command("mcdc.set", key, "old") == "OK"
-    prev = r.execute_command("mcdc.getset", key, "new")
-    assert prev == "old"
-    assert r.execute_command("mcdc.get", key) == "new"
+    assert r.execute_command(cmd(variant, "set"), key, b"old") == ok_reply(variant)
+    prev = r.execute_command(cmd(variant, "getset"), key, b"new")
+    assert prev == b"old"
+    assert r.execute_command(cmd(variant, "get"), key) == b"new"
 
     # GETDEL returns current value and removes key
-    val = r.execute_command("mcdc.getdel", key)
-    assert val == "new"
+    val = r.execute_command(cmd(variant, "getdel"), key)
+    assert val == b"new"
     assert r.exists(key) == 0
 
 
-def test_filter_getset_getdel(r):
-    key = "mcdc:filter:string:getsetdel"
-
-    r.set(key, "old")
-    prev = r.execute_command("GETSET", key, "new")
-    assert prev == "old"
-    assert r.get(key) == "new"
-
-    val = r.execute_command("GETDEL", key)
-    assert val == "new"
-    assert r.exists(key) == 0
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_setex_setnx_psetex(r, variant):
+    key1 = f"{r.key_prefix}:string:setex"
+    key2 = f"{r.key_prefix}:string:setnx"
+    key3 = f"{r.key_prefix}:string:psetex"
+
+    with r.pipeline(transaction=False) as p:
+        # SETEX
+        p.execute_command(cmd(variant, "setex"), key1, 5, b"v1")
+        p.execute_command(cmd(variant, "get"), key1)
+        p.ttl(key1)
+        # SETNX
+        p.execute_command(cmd(variant, "setnx"), key2, b"first")
+        p.execute_command(cmd(variant, "setnx"), key2, b"second")
+        p.execute_command(cmd(variant, "get"), key2)
+        # PSETEX
+        p.execute_command(cmd(variant, "psetex"), key3, 1000, b"v3")
+        p.execute_command(cmd(variant, "get"), key3)
+        p.pttl(key3)
+        (setex, get1, ttl1,
+         res, res2, get2,
+         psetex, get3, pttl) = p.execute()
+
+    assert setex == ok_reply(variant)
+    assert get1 == b"v1"
+    assert 1 <= ttl1 <= 5
 
-
-def test_mcdc_setex_setnx_psetex(r):
-    key1 = "mcdc:string:setex"
-    key2 = "mcdc:string:setnx"
-    key3 = "mcdc:string:psetex"
-
-    # SETEX
-    assert r.execute_command("mcdc.setex", key1, 5, "v1") == "OK"
-    assert r.execute_command("mcdc.get", key1) == "v1"
-    assert 1 <= r.ttl(key1) <= 5
-
-    # SETNX
-    res = r.execute_command("mcdc.setnx", key2, "first")
     assert res == 1
-    res2 = r.execute_command("mcdc.setnx", key2, "second")
     assert res2 == 0
-    assert r.execute_command("mcdc.get", key2) == "first"
-
-    # PSETEX
-    assert r.execute_command("mcdc.psetex", key3, 1000, "v3") == "OK"
-    assert r.execute_command("mcdc.get", key3) == "v3"
-    pttl = r.pttl(key3)
-    assert 0 < pttl <= 1000
-
-
-def test_filter_setex_setnx_psetex(r):
-    key1 = "mcdc:filter:string:setex"
-    key2 = "mcdc:filter:string:setnx"
-    key3 = "mcdc:filter:string:psetex"
+    assert get2 == b"first"
 
-    r.execute_command("SETEX", key1, 5, "v1")
-    assert r.get(key1) == "v1"
-    assert 1 <= r.ttl(key1) <= 5
-
-    assert r.setnx(key2, "first") == 1
-    assert r.setnx(key2, "second") == 0
-    assert r.get(key2) == "first"
-
-    r.execute_command("PSETEX", key3, 1000, "v3")
-    assert r.get(key3) == "v3"
-    pttl = r.pttl(key3)
+    assert psetex == ok_reply(variant)
+    assert get3 == b"v3"
     assert 0 < pttl <= 1000
 
 
@@ -173,51 +121,26 @@ def test_filter_setex_setnx_psetex(r):
 # MGET / MSET (module and filter)
 # ---------------------------------------------------------------------------
 
-def test_mcdc_mset_mget_compressible_mixed(r):
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_mset_mget_compressible_mixed(r, variant):
     keys_vals = {
-        "mcdc:string:mset:small1": "foo",
-        "mcdc:string:mset:small2": "bar",
-        "mcdc:string:mset:large1": highly_compressible(1024, "Z"),
-        "mcdc:string:mset:large2": highly_compressible(2048, "Q"),
+        f"{r.key_prefix}:string:mset:small1": b"foo",
+        f"{r.key_prefix}:string:mset:small2": b"bar",
+        f"{r.key_prefix}:string:mset:large1": highly_compressible(1024, "Z"),
+        f"{r.key_prefix}:string:mset:large2": highly_compressible(2048, "Q"),
     }
 
-    args = []
-    for k, v in keys_vals.items():
-        args.append(k)
-        args.append(v)
+    args = list(itertools.chain.from_iterable(keys_vals.items()))
 
-    # module command
-    res = r.execute_command("mcdc.mset", *args)
-    assert res in ("OK", "QUEUED")  # depending on async plumbing
+    res = r.execute_command(cmd(variant, "mset"), *args)
+    assert res in (ok_reply(variant), b"QUEUED")  # depending on async plumbing
 
-    vals = r.execute_command("mcdc.mget", *keys_vals.keys())
+    vals = r.execute_command(cmd(variant, "mget"), *keys_vals.keys())
     assert vals == list(keys_vals.values())
 
     # Check at least one is compressed
-    logical = r.strlen("mcdc:string:mset:large1")
-    cstored = int(r.execute_command("mcdc.cstrlen", "mcdc:string:mset:large1"))
-    assert logical > 32
-    assert cstored < logical
-
-
-def test_filter_mset_mget(r):
-    keys_vals = {
-        "mcdc:filter:string:mset:small": "hello",
-        "mcdc:filter:string:mset:large": highly_compressible(2048, "L"),
-    }
-
-    # Plain MSET
-    args = []
-    for k, v in keys_vals.items():
-        args.append(k)
-        args.append(v)
-    r.execute_command("MSET", *args)
-
-    vals = r.execute_command("MGET", *keys_vals.keys())
-    assert vals == list(keys_vals.values())
-
-    logical = r.strlen("mcdc:filter:string:mset:large")
-    cstored = int(r.execute_command("mcdc.cstrlen", "mcdc:filter:string:mset:large"))
+    logical = r.strlen(f"{r.key_prefix}:string:mset:large1")
+    cstored = int(r.execute_command("mcdc.cstrlen", f"{r.key_prefix}:string:mset:large1"))
     assert logical > 32
     assert cstored < logical
 
@@ -227,44 +150,29 @@ def test_filter_mset_mget(r):
 # (They downgrade compressed values to raw, then delegate.)
 # ---------------------------------------------------------------------------
 
-def test_mcdc_append_getrange_setrange(r):
-    key = "mcdc:string:append"
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_append_getrange_setrange(r, variant):
+    key = f"{r.key_prefix}:string:append"
     base = highly_compressible(256, "A")
-    assert r.execute_command("mcdc.set", key, base) == "OK"
-
-    # APPEND (should downgrade if compressed, then append)
-    added = r.execute_command("mcdc.append", key, "TAIL")
-    assert added == len(base) + len("TAIL")
-
-    val = r.execute_command("mcdc.get", key)
-    assert val == base + "TAIL"
-
-    # GETRANGE
-    sub = r.execute_command("mcdc.getrange", key, 0, 3)
-    assert sub == (base + "TAIL")[0:4]
-
-    # SETRANGE
-    reslen = r.execute_command("mcdc.setrange", key, 0, "HEAD")
-    assert reslen == len(base) + len("TAIL")
-    val2 = r.execute_command("mcdc.get", key)
-    assert val2.startswith("HEAD")
-
-
-def test_filter_append_getrange_setrange(r):
-    key = "mcdc:filter:string:append"
-    base = highly_compressible(256, "B")
-    r.set(key, base)
-
-    added = r.execute_command("APPEND", key, "TAIL")
-    assert added == len(base) + len("TAIL")
-
-    sub = r.execute_command("GETRANGE", key, 0, 3)
-    assert sub == (base + "TAIL")[0:4]
 
-    reslen = r.execute_command("SETRANGE", key, 0, "HEAD")
-    assert reslen == len(base) + len("TAIL")
-    val2 = r.get(key)
-    assert val2.startswith("HEAD")
+    with r.pipeline(transaction=False) as p:
+        p.execute_command(cmd(variant, "set"), key, base)
+        # APPEND (should downgrade if compressed, then append)
+        p.execute_command(cmd(variant, "append"), key, b"TAIL")
+        p.execute_command(cmd(variant, "get"), key)
+        # GETRANGE
+        p.execute_command(cmd(variant, "getrange"), key, 0, 3)
+        # SETRANGE
+        p.execute_command(cmd(variant, "setrange"), key, 0, b"HEAD")
+        p.execute_command(cmd(variant, "get"), key)
+        ok, added, val, sub, reslen, val2 = p.execute()
+
+    assert ok == ok_reply(variant)
+    assert added == len(base) + len(b"TAIL")
+    assert val == base + b"TAIL"
+    assert sub == (base + b"TAIL")[0:4]
+    assert reslen == len(base) + len(b"TAIL")
+    assert val2.startswith(b"HEAD")
 
 def test_mcdc_msetasync_matches_mset_and_writes(r):
     """
@@ -273,14 +181,11 @@ def test_mcdc_msetasync_matches_mset_and_writes(r):
       - write the same data as mcdc.mset
     """
     keys_vals = {
-        "mcdc:string:async:mset:1": "v1",
-        "mcdc:string:async:mset:2": highly_compressible(128, "X"),
+        f"{r.key_prefix}:string:async:mset:1": b"v1",
+        f"{r.key_prefix}:string:async:mset:2": highly_compressible(128, "X"),
     }
 
-    args = []
-    for k, v in keys_vals.items():
-        args.append(k)
-        args.append(v)
+    args = list(itertools.chain.from_iterable(keys_vals.items()))
 
     # Baseline: sync mset behavior
     r.delete(*keys_vals.keys())
@@ -307,16 +212,13 @@ def test_mcdc_mgetasync_matches_mget(r):
       - return same data as mcdc.mget
     """
     keys_vals = {
-        "mcdc:string:async:mget:1": "foo",
-        "mcdc:string:async:mget:2": highly_compressible(256, "Y"),
-        "mcdc:string:async:mget:3": "bar",
+        f"{r.key_prefix}:string:async:mget:1": b"foo",
+        f"{r.key_prefix}:string:async:mget:2": highly_compressible(256, "Y"),
+        f"{r.key_prefix}:string:async:mget:3": b"bar",
     }
 
     # Prepare data via sync path
-    args = []
-    for k, v in keys_vals.items():
-        args.append(k)
-        args.append(v)
+    args = list(itertools.chain.from_iterable(keys_vals.items()))
 
     r.delete(*keys_vals.keys())
     r.execute_command("mcdc.mset", *args)